@@ -0,0 +1,335 @@
+import json
+import re
+import argparse
+from typing import List, Dict, Any
+
+import numpy as np
+
+import profiling
+from make_promts import PROMPT_TEMPLATES
+from processing import CHUNKING_CONFIG_PATH, split_text_into_chunks
+
+# === НАСТРОЙКИ ===
+INPUT_PATH = "output/troe_iz_lesa.json"
+TOKENIZER_NAME = "yandex/YandexGPT-5-Lite-8B-pretrain"  # локальный кэш HuggingFace
+CONTEXT_LIMIT = 8192         # контекст модели в токенах
+MAX_OUTPUT_TOKENS = 1024     # резерв под ответ, как MAX_TOKENS в get_questions
+MAX_CHUNK_TOKENS = 1024      # верхняя граница чанка: без нее оптимум вырождается в "глава = чанк"
+TARGET_COVERAGE = 0.97       # доля слов корпуса, попавших хотя бы в один чанк
+PROMPTS_PER_CHUNK = 3
+CHUNK_SIZES = range(100, 1501, 25)               # кандидаты chunk_size, в словах
+OVERLAP_RATIOS = (0.0, 0.05, 0.1, 0.15, 0.2, 0.3)  # кандидаты overlap, доля от chunk_size
+HISTOGRAM_BINS = 12
+WORD_ANCHOR = "и"  # слово перед токенизируемым: слово считается с ведущим пробелом, как внутри чанка
+
+
+class TokenCounter:
+    """
+    Подсчет токенов локальным токенизатором.
+
+    Если transformers или веса токенизатора недоступны, используется
+    приближение: слова и знаки препинания, длинные слова делятся по 4 символа
+    (типичная длина BPE-токена для русского текста).
+    """
+
+    def __init__(self, name: str = TOKENIZER_NAME):
+        self.name = name
+        self._tokenizer = None
+        try:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(name)
+        except Exception as e:
+            print(f"⚠️ Токенизатор {name} недоступен ({e}), используем приближенный подсчет")
+            self.name = "approx"
+
+    def lengths(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros(0, dtype=np.int64)
+        if self._tokenizer is not None:
+            ids = self._tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+            return np.fromiter((len(x) for x in ids), dtype=np.int64, count=len(ids))
+        return np.fromiter((self._approx(t) for t in texts), dtype=np.int64, count=len(texts))
+
+    @staticmethod
+    def _approx(text: str) -> int:
+        return sum((len(piece) + 3) // 4 for piece in re.findall(r'\w+|[^\w\s]', text))
+
+    def count(self, text: str) -> int:
+        return int(self.lengths([text])[0])
+
+
+# === Подготовка корпуса ===
+def load_chapters(input_file: str) -> List[Dict[str, Any]]:
+    """Главы в том же виде, в каком их режет processing.create_chunks_dataset."""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    chapters = []
+    for part_data in data:
+        part_name = part_data.get("part", "Неизвестная часть")
+        for chapter_data in part_data.get("chapters", []):
+            chapter_text = re.sub(r'\s+', ' ', chapter_data.get("text", "")).strip()
+            if not chapter_text:
+                continue
+            chapters.append({
+                "words": chapter_text.split(),
+                "metadata": {
+                    "author": "Юрий Никитин",
+                    "book_name": "Трое из леса",
+                    "part": f"{part_name}",
+                    "chapter": f"{chapter_data.get('chapter', 'Неизвестная глава')}"
+                }
+            })
+    return chapters
+
+
+def prepare_corpus(chapters: List[Dict[str, Any]], counter: TokenCounter) -> List[Dict[str, Any]]:
+    """
+    Для каждой главы считает префиксные суммы токенов по словам и позиции слов с точкой.
+
+    Токенизатор вызывается один раз на уникальное слово корпуса; токены чанка
+    затем считаются разностью префиксных сумм, без повторной токенизации.
+    Внутри чанка слово идет после пробела, а BPE кодирует пробел вместе со
+    словом, поэтому слово токенизируется как "WORD_ANCHOR слово" за вычетом
+    токенов WORD_ANCHOR. Остаточная погрешность проверяется в validate_estimate.
+    """
+    all_words = np.array([w for ch in chapters for w in ch["words"]], dtype=object)
+    uniques, inverse = np.unique(all_words, return_inverse=True)
+    anchor_tokens = counter.count(WORD_ANCHOR)
+    word_tokens = counter.lengths([f"{WORD_ANCHOR} {w}" for w in uniques]) - anchor_tokens
+    word_tokens = np.maximum(word_tokens, 1)[inverse]
+    has_dot = np.fromiter(('.' in w for w in uniques), dtype=bool, count=len(uniques))[inverse]
+
+    corpus = []
+    offset = 0
+    for ch in chapters:
+        n = len(ch["words"])
+        tokens = word_tokens[offset:offset + n]
+        corpus.append({
+            "n_words": n,
+            "cumsum": np.concatenate(([0], np.cumsum(tokens))),
+            "dots": np.flatnonzero(has_dot[offset:offset + n]),
+            # накладные токены промтов make_promts (шаблон + метаданные главы) без текста чанка
+            "overheads": counter.lengths([
+                t["template"].format(text="", metadata=ch["metadata"]) for t in PROMPT_TEMPLATES
+            ]),
+        })
+        offset += n
+    return corpus
+
+
+# === Симуляция нарезки ===
+def chunk_spans(n_words: int, chunk_size: int, overlap: int):
+    """
+    Границы чанков [start, end) в словах — так же, как их выбирает
+    processing.split_text_into_chunks, включая склейку хвоста в последний чанк.
+    """
+    if n_words == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    step = chunk_size - overlap
+    last = max(0, -(-(n_words - chunk_size) // step))
+    starts = np.arange(last + 1, dtype=np.int64) * step
+    ends = np.minimum(starts + chunk_size, n_words)
+    return starts, ends
+
+
+def simulate(corpus: List[Dict[str, Any]], chunk_size: int, overlap: int,
+             prompts_per_chunk: int = PROMPTS_PER_CHUNK) -> Dict[str, Any]:
+    """
+    Оценивает настройку (chunk_size, overlap) без фактической нарезки текста.
+
+    Обрезка по предложениям (processing.trim_to_sentences) моделируется по
+    словам с точкой: от слова после первой точки до слова с последней точкой.
+    """
+    overheads = np.array([ch["overheads"][:prompts_per_chunk] for ch in corpus])
+    chunk_tokens = []
+    chunk_overheads = []
+    covered = 0
+    total_words = 0
+
+    for ch, overhead in zip(corpus, overheads):
+        n, dots, cumsum = ch["n_words"], ch["dots"], ch["cumsum"]
+        total_words += n
+        starts, ends = chunk_spans(n, chunk_size, overlap)
+        if len(dots) == 0 or len(starts) == 0:
+            continue
+
+        first = np.searchsorted(dots, starts)
+        last = np.searchsorted(dots, ends) - 1
+        first_c = np.minimum(first, len(dots) - 1)
+        valid = (first < len(dots)) & (last > first)
+        if not valid.any():
+            continue
+
+        keep_start = dots[first_c[valid]] + 1
+        keep_end = dots[last[valid]] + 1
+        chunk_tokens.append(cumsum[keep_end] - cumsum[keep_start])
+        chunk_overheads.append(np.broadcast_to(overhead, (valid.sum(), len(overhead))))
+
+        diff = np.zeros(n + 1, dtype=np.int64)
+        np.add.at(diff, keep_start, 1)
+        np.add.at(diff, keep_end, -1)
+        covered += int((np.cumsum(diff)[:n] > 0).sum())
+
+    if not chunk_tokens:
+        return {"chunk_size": chunk_size, "overlap": overlap, "n_chunks": 0,
+                "coverage": 0.0, "total_prompt_tokens": 0, "max_prompt_tokens": 0,
+                "max_chunk_tokens": 0, "chunk_tokens": np.zeros(0, dtype=np.int64)}
+
+    tokens = np.concatenate(chunk_tokens)
+    chunk_overheads = np.concatenate(chunk_overheads)
+    prompts = chunk_overheads + tokens[:, None]
+    return {
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "n_chunks": int(len(tokens)),
+        "coverage": covered / total_words if total_words else 0.0,
+        "total_prompt_tokens": int(prompts.sum()),
+        "max_prompt_tokens": int(prompts.max()),
+        "max_chunk_tokens": int(tokens.max()),
+        "chunk_tokens": tokens,
+    }
+
+
+def recommend(corpus: List[Dict[str, Any]], context_limit: int = CONTEXT_LIMIT,
+              max_output_tokens: int = MAX_OUTPUT_TOKENS, max_chunk_tokens: int = MAX_CHUNK_TOKENS,
+              target_coverage: float = TARGET_COVERAGE):
+    """
+    Перебирает сетку (chunk_size, overlap) и выбирает допустимую настройку
+    с минимальным суммарным числом токенов промтов make_promts.
+
+    Returns:
+        (лучший результат simulate или None, список всех результатов)
+    """
+    results = []
+    for chunk_size in CHUNK_SIZES:
+        for ratio in OVERLAP_RATIOS:
+            overlap = int(chunk_size * ratio)
+            results.append(simulate(corpus, chunk_size, overlap))
+
+    feasible = [
+        r for r in results
+        if r["n_chunks"] > 0
+        and r["max_prompt_tokens"] + max_output_tokens <= context_limit
+        and r["max_chunk_tokens"] <= max_chunk_tokens
+        and r["coverage"] >= target_coverage
+    ]
+    best = min(feasible, key=lambda r: (r["total_prompt_tokens"], -r["coverage"]), default=None)
+    return best, results
+
+
+def validate_estimate(chapters: List[Dict[str, Any]], best: Dict[str, Any],
+                      counter: TokenCounter) -> Dict[str, Any]:
+    """
+    Режет корпус processing.split_text_into_chunks с выбранной настройкой,
+    токенизирует настоящие чанки целиком и сравнивает с оценкой simulate.
+    """
+    chunks = [
+        chunk
+        for ch in chapters
+        for chunk in split_text_into_chunks(' '.join(ch["words"]), best["chunk_size"], best["overlap"])
+    ]
+    actual = counter.lengths(chunks)
+    estimated = best["chunk_tokens"]
+    actual_total = int(actual.sum())
+    return {
+        "actual_chunks": int(len(actual)),
+        "estimated_chunks": int(len(estimated)),
+        "actual_chunk_tokens": actual_total,
+        "estimated_chunk_tokens": int(estimated.sum()),
+        "relative_error": (int(estimated.sum()) - actual_total) / actual_total if actual_total else 0.0,
+        "actual_max_chunk_tokens": int(actual.max()) if len(actual) else 0,
+    }
+
+
+# === Отчет ===
+def print_histogram(title: str, values: np.ndarray, bins: int = HISTOGRAM_BINS) -> None:
+    counts, edges = np.histogram(values, bins=bins)
+    scale = 40 / max(1, counts.max())
+    print(f"\n{title} (n={len(values)}, медиана {np.median(values):.0f}, "
+          f"p95 {np.percentile(values, 95):.0f}, макс {values.max()})")
+    for count, lo, hi in zip(counts, edges[:-1], edges[1:]):
+        print(f"  {lo:8.0f}–{hi:<8.0f} {count:6d} {'█' * int(count * scale)}")
+
+
+def analyze_corpus(input_file: str = INPUT_PATH, config_path: str = CHUNKING_CONFIG_PATH,
+                   counter: TokenCounter = None, context_limit: int = CONTEXT_LIMIT,
+                   max_output_tokens: int = MAX_OUTPUT_TOKENS, max_chunk_tokens: int = MAX_CHUNK_TOKENS,
+                   target_coverage: float = TARGET_COVERAGE) -> Dict[str, Any]:
+    """
+    Распределения длин корпуса в токенах и подбор chunk_size/overlap.
+    Рекомендация записывается в config_path для processing.py.
+    """
+    with profiling.span("read"):
+        chapters = load_chapters(input_file)
+
+    with profiling.span("transform"):
+        counter = counter or TokenCounter()
+        corpus = prepare_corpus(chapters, counter)
+        chapter_words = np.array([ch["n_words"] for ch in corpus])
+        chapter_tokens = np.array([int(ch["cumsum"][-1]) for ch in corpus])
+
+        print("=== Анализ корпуса ===")
+        print(f"Токенизатор: {counter.name}")
+        print(f"Глав: {len(corpus)}, слов: {chapter_words.sum()}, токенов: {chapter_tokens.sum()}")
+        print(f"Токенов на слово: {chapter_tokens.sum() / max(1, chapter_words.sum()):.2f}")
+        print_histogram("Длина главы, токенов", chapter_tokens)
+
+        best, results = recommend(corpus, context_limit, max_output_tokens, max_chunk_tokens, target_coverage)
+
+    if best is None:
+        print("\n⚠️ Ни одна настройка не удовлетворяет ограничениям, конфиг не записан")
+        return {}
+
+    with profiling.span("validate"):
+        check = validate_estimate(chapters, best, counter)
+    print(f"\nПроверка оценки на настоящих чанках: {check['actual_chunk_tokens']} токенов "
+          f"против {check['estimated_chunk_tokens']} оценки (ошибка {check['relative_error']:+.2%}), "
+          f"чанков {check['actual_chunks']} против {check['estimated_chunks']}")
+    if check["actual_max_chunk_tokens"] > max_chunk_tokens:
+        print(f"⚠️ Самый длинный настоящий чанк {check['actual_max_chunk_tokens']} токенов "
+              f"больше MAX_CHUNK_TOKENS={max_chunk_tokens}")
+
+    print_histogram(f"Длина чанка, токенов (chunk_size={best['chunk_size']}, overlap={best['overlap']})",
+                    best["chunk_tokens"])
+
+    config = {
+        "chunk_size": best["chunk_size"],
+        "overlap": best["overlap"],
+        "stats": {
+            "tokenizer": counter.name,
+            "n_chunks": best["n_chunks"],
+            "coverage": round(best["coverage"], 4),
+            "total_prompt_tokens": best["total_prompt_tokens"],
+            "max_prompt_tokens": best["max_prompt_tokens"],
+            "context_limit": context_limit,
+            "max_output_tokens": max_output_tokens,
+            "max_chunk_tokens": max_chunk_tokens,
+            "target_coverage": target_coverage,
+            "candidates": len(results),
+            "estimate_check": check,
+        }
+    }
+    with profiling.span("write"):
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+
+    print(f"\nРекомендация: chunk_size={best['chunk_size']}, overlap={best['overlap']} "
+          f"({best['n_chunks']} чанков, покрытие {best['coverage']:.1%}, "
+          f"{best['total_prompt_tokens']} токенов промтов)")
+    print(f"Конфиг сохранен в: {config_path}")
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Анализ корпуса в токенах и подбор параметров нарезки")
+    parser.add_argument("--context-limit", type=int, default=CONTEXT_LIMIT)
+    parser.add_argument("--max-output-tokens", type=int, default=MAX_OUTPUT_TOKENS)
+    parser.add_argument("--max-chunk-tokens", type=int, default=MAX_CHUNK_TOKENS)
+    parser.add_argument("--target-coverage", type=float, default=TARGET_COVERAGE)
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling.StageProfiler("analytics", enabled=args.profile):
+        analyze_corpus(context_limit=args.context_limit, max_output_tokens=args.max_output_tokens,
+                       max_chunk_tokens=args.max_chunk_tokens, target_coverage=args.target_coverage)
@@ -0,0 +1,160 @@
+import os
+import json
+import urllib.request
+from abc import ABC, abstractmethod
+from typing import List, Dict
+from dotenv import load_dotenv
+
+# === НАСТРОЙКИ ===
+# Бэкенд выбирается переменной COMPLETION_BACKEND в .env или флагом --backend
+DEFAULT_BACKEND = "yandex"
+
+# Yandex Cloud ML SDK
+FOLDER_ID = "b1ge6b93hbtf0j5b7ptt"  # Замени на твой folder_id
+YANDEX_MODEL = "yandexgpt-lite"
+
+# OpenAI-совместимый HTTP-эндпоинт (vLLM, OpenRouter, OpenAI и т.п.)
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+OPENAI_MODEL = "gpt-4o-mini"
+
+# Локальный llama.cpp сервер на CPU, например:
+#   llama-server -m model.gguf --parallel 8 --cont-batching --port 8080
+LLAMA_CPP_BASE_URL = "http://127.0.0.1:8080/v1"
+LLAMA_CPP_MODEL = "local"
+LLAMA_CPP_PARALLEL = 8  # = --parallel сервера: столько запросов он батчит одновременно
+
+REQUEST_TIMEOUT = 120
+
+
+class CompletionBackend(ABC):
+    """
+    Общий интерфейс генерации для get_questions и get_answers.
+
+    Сообщения передаются в формате Yandex SDK: [{"role": ..., "text": ...}].
+    concurrency — сколько параллельных запросов имеет смысл держать
+    (None — решает этап, MAX_WORKERS).
+    """
+
+    name = "base"
+    concurrency = None
+
+    @abstractmethod
+    def complete(self, messages: List[Dict[str, str]]) -> str:
+        """Текст ответа модели на сообщения."""
+
+
+class YandexBackend(CompletionBackend):
+    """YandexGPT через yandex_cloud_ml_sdk, ключ берется из YANDEX_API."""
+
+    name = "yandex"
+
+    def __init__(self, temperature: float, max_tokens: int,
+                 folder_id: str = FOLDER_ID, model_name: str = YANDEX_MODEL):
+        from yandex_cloud_ml_sdk import YCloudML
+
+        api_key = os.getenv("YANDEX_API")
+        if not api_key:
+            raise ValueError("Ошибка: YANDEX_API не найден в .env файле")
+
+        self.sdk = YCloudML(folder_id=folder_id, auth=api_key)
+        self.sdk.setup_default_logging()
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def complete(self, messages):
+        model = self.sdk.chat.completions(self.model_name).configure(
+            temperature=self.temperature, max_tokens=self.max_tokens
+        )
+        result = model.run(messages)
+        return result.text if hasattr(result, "text") else str(result)
+
+
+class OpenAICompatibleBackend(CompletionBackend):
+    """Любой сервер с /chat/completions в формате OpenAI."""
+
+    name = "openai"
+
+    def __init__(self, temperature: float, max_tokens: int,
+                 base_url: str = OPENAI_BASE_URL, model_name: str = OPENAI_MODEL,
+                 api_key: str = None, timeout: float = REQUEST_TIMEOUT):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model_name = model_name
+        self.api_key = api_key
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+
+    def complete(self, messages):
+        payload = {
+            "model": self.model_name,
+            "messages": [{"role": m["role"], "content": m["text"]} for m in messages],
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode("utf-8"), headers=headers, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = json.loads(response.read().decode("utf-8"))
+        return body["choices"][0]["message"]["content"] or ""
+
+
+class LlamaCppBackend(OpenAICompatibleBackend):
+    """
+    Локальная модель на CPU через llama.cpp server (OpenAI-совместимый API).
+
+    Сервер с --cont-batching объединяет одновременные запросы в один батч,
+    поэтому этапы держат ровно LLAMA_CPP_PARALLEL запросов в полете —
+    по одному на слот сервера. Сеть и API-ключ не нужны.
+    """
+
+    name = "llama_cpp"
+
+    def __init__(self, temperature: float, max_tokens: int,
+                 base_url: str = LLAMA_CPP_BASE_URL, model_name: str = LLAMA_CPP_MODEL,
+                 parallel: int = LLAMA_CPP_PARALLEL, timeout: float = REQUEST_TIMEOUT):
+        super().__init__(temperature, max_tokens, base_url=base_url,
+                         model_name=model_name, timeout=timeout)
+        self.concurrency = parallel
+
+
+BACKENDS = {
+    YandexBackend.name: YandexBackend,
+    OpenAICompatibleBackend.name: OpenAICompatibleBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+}
+
+
+def create_backend(name: str = None, temperature: float = 0.3, max_tokens: int = 1024) -> CompletionBackend:
+    """
+    Создает бэкенд по имени (yandex, openai, llama_cpp).
+
+    Параметры подключения можно переопределить в .env:
+        COMPLETION_BACKEND, OPENAI_BASE_URL, OPENAI_MODEL, OPENAI_API_KEY,
+        LLAMA_CPP_BASE_URL, LLAMA_CPP_MODEL, LLAMA_CPP_PARALLEL
+    """
+    load_dotenv()
+    name = name or os.getenv("COMPLETION_BACKEND", DEFAULT_BACKEND)
+
+    if name == YandexBackend.name:
+        return YandexBackend(temperature, max_tokens)
+    if name == OpenAICompatibleBackend.name:
+        return OpenAICompatibleBackend(
+            temperature, max_tokens,
+            base_url=os.getenv("OPENAI_BASE_URL", OPENAI_BASE_URL),
+            model_name=os.getenv("OPENAI_MODEL", OPENAI_MODEL),
+            api_key=os.getenv("OPENAI_API_KEY"),
+        )
+    if name == LlamaCppBackend.name:
+        return LlamaCppBackend(
+            temperature, max_tokens,
+            base_url=os.getenv("LLAMA_CPP_BASE_URL", LLAMA_CPP_BASE_URL),
+            model_name=os.getenv("LLAMA_CPP_MODEL", LLAMA_CPP_MODEL),
+            parallel=int(os.getenv("LLAMA_CPP_PARALLEL", LLAMA_CPP_PARALLEL)),
+        )
+    raise ValueError(f"Неизвестный бэкенд: {name}. Доступны: {', '.join(BACKENDS)}")
@@ -0,0 +1,226 @@
+import os
+import json
+import math
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+from typing import List, Dict, Any
+
+import numpy as np
+
+import profiling
+from analytics import TokenCounter
+
+# === НАСТРОЙКИ ===
+INPUT_PATH = "output/output_with_model_responses.jsonl"
+EXPORT_DIR = "output/export"
+SEED = 42
+# размер корзины перемешивания на диске; после json.loads она занимает в памяти
+# в несколько раз больше (строки и словари Python), порядка 5-10x
+MAX_BUCKET_BYTES = 16 * 2 ** 20
+MAX_OPEN_FILES = 256              # сколько корзин пишем одновременно
+VALIDATION_FRACTION = 0.05
+SPLIT_SALT = "split-v1"           # смена соли пересобирает разбиение
+LENGTH_BOUNDS = (128, 256, 512, 1024)  # границы длинных корзин, в токенах
+SHARD_ROWS = 10000                # строк в одном выходном шарде
+
+
+# === Разбиение ===
+def group_key(row: Dict[str, Any]) -> str:
+    """
+    Ключ группы для разбиения: все вопросы одной главы попадают в один сплит,
+    иначе перекрывающиеся чанки главы протекают между train и validation.
+    Для строк без chapter_id (старые выгрузки) — текст вопроса.
+    """
+    return row.get("chapter_id") or row["request"][0]["text"]
+
+
+def assign_split(key: str, validation_fraction: float = VALIDATION_FRACTION,
+                 salt: str = SPLIT_SALT) -> str:
+    """Детерминированный сплит по хешу ключа, не зависит от порядка и размера данных."""
+    digest = hashlib.sha1(f"{salt}:{key}".encode("utf-8")).digest()
+    return "validation" if int.from_bytes(digest[:8], "big") / 2 ** 64 < validation_fraction else "train"
+
+
+def row_text(row: Dict[str, Any]) -> str:
+    return "\n".join(r.get("text", "") for r in row["request"]) + "\n" + row.get("response", "")
+
+
+def length_bucket_name(bucket: int, bounds=LENGTH_BOUNDS) -> str:
+    lo = bounds[bucket - 1] if bucket > 0 else 0
+    hi = f"{bounds[bucket] - 1:04d}" if bucket < len(bounds) else "max"
+    return f"len_{lo:04d}-{hi}"
+
+
+# === Внешнее перемешивание ===
+def scatter(input_file: str, tmp_dir: str, rng: random.Random, prefix: str = "bucket") -> List[str]:
+    """
+    Первый проход: раскладывает строки по случайным временным файлам так,
+    чтобы каждый был не больше MAX_BUCKET_BYTES.
+
+    Одновременно открыто не больше MAX_OPEN_FILES файлов. Если корзин нужно
+    больше, переполненные корзины раскладываются тем же способом еще раз.
+    """
+    size = os.path.getsize(input_file)
+    n_buckets = min(MAX_OPEN_FILES, max(1, math.ceil(size / MAX_BUCKET_BYTES)))
+    paths = [os.path.join(tmp_dir, f"{prefix}_{i:05d}.jsonl") for i in range(n_buckets)]
+    files = [open(p, "w", encoding="utf-8") for p in paths]
+    try:
+        with open(input_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    files[rng.randrange(n_buckets)].write(line if line.endswith("\n") else line + "\n")
+    finally:
+        for f in files:
+            f.close()
+
+    result = []
+    for path in paths:
+        bucket_size = os.path.getsize(path)
+        # корзина того же размера, что и вход (одна длинная строка), не делится
+        if bucket_size > MAX_BUCKET_BYTES and bucket_size < size:
+            result.extend(scatter(path, tmp_dir, rng, prefix=os.path.basename(path)[:-len(".jsonl")]))
+            os.remove(path)
+        else:
+            result.append(path)
+    return result
+
+
+def iter_shuffled(bucket_paths: List[str], rng: random.Random):
+    """Второй проход: корзины в случайном порядке, каждая перемешивается в памяти."""
+    order = list(bucket_paths)
+    rng.shuffle(order)
+    for path in order:
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        os.remove(path)
+        rng.shuffle(rows)
+        yield rows
+
+
+# === Запись ===
+class ShardWriter:
+    """Пишет строки одной (сплит, длина) пары в шарды по SHARD_ROWS строк."""
+
+    def __init__(self, export_dir: str, split: str, bucket_name: str, shard_rows: int = SHARD_ROWS):
+        self.dir = os.path.join(export_dir, split)
+        self.split = split
+        self.bucket_name = bucket_name
+        self.shard_rows = shard_rows
+        self.shards = []
+        self._file = None
+        self._tokens = []
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _roll(self):
+        self._close_current()
+        path = os.path.join(self.dir, f"{self.bucket_name}-{len(self.shards):05d}.jsonl")
+        self._file = open(path, "w", encoding="utf-8")
+        self.shards.append({"path": path, "split": self.split, "length_bucket": self.bucket_name})
+
+    def _close_current(self):
+        if self._file is None:
+            return
+        self._file.close()
+        tokens = np.array(self._tokens, dtype=np.int32)
+        shard = self.shards[-1]
+        # поштучные длины для сэмплеров, группирующих батчи по длине
+        shard["tokens_path"] = shard["path"][:-len(".jsonl")] + ".tokens.npy"
+        np.save(shard["tokens_path"], tokens)
+        shard.update(rows=int(len(tokens)), tokens=int(tokens.sum()),
+                     min_tokens=int(tokens.min()), max_tokens=int(tokens.max()))
+        self._file = None
+        self._tokens = []
+
+    def write(self, row: Dict[str, Any], tokens: int):
+        if self._file is None or len(self._tokens) >= self.shard_rows:
+            self._roll()
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._tokens.append(tokens)
+
+    def close(self):
+        self._close_current()
+
+
+def export_dataset(input_file: str = INPUT_PATH, export_dir: str = EXPORT_DIR, seed: int = SEED,
+                   validation_fraction: float = VALIDATION_FRACTION,
+                   counter: TokenCounter = None) -> Dict[str, Any]:
+    """
+    Перемешивает датасет с ограниченной памятью, делит на train/validation
+    по чанкам и пишет шарды, сгруппированные по длине в токенах.
+
+    В выходные строки попадают только request и response.
+
+    Returns:
+        Индекс выгрузки (также сохраняется в export_dir/index.json)
+    """
+    counter = counter or TokenCounter()
+    rng = random.Random(seed)
+
+    for split in ("train", "validation"):
+        shutil.rmtree(os.path.join(export_dir, split), ignore_errors=True)
+    os.makedirs(export_dir, exist_ok=True)
+
+    writers = {}
+    with tempfile.TemporaryDirectory(dir=export_dir) as tmp_dir:
+        with profiling.span("read"):
+            bucket_paths = scatter(input_file, tmp_dir, rng)
+
+        with profiling.span("transform"):
+            for rows in iter_shuffled(bucket_paths, rng):
+                if not rows:
+                    continue
+                tokens = counter.lengths([row_text(r) for r in rows])
+                buckets = np.searchsorted(LENGTH_BOUNDS, tokens, side="right")
+                for row, n_tokens, bucket in zip(rows, tokens, buckets):
+                    split = assign_split(group_key(row), validation_fraction)
+                    key = (split, int(bucket))
+                    if key not in writers:
+                        writers[key] = ShardWriter(export_dir, split, length_bucket_name(int(bucket)))
+                    writers[key].write({"request": row["request"], "response": row.get("response", "")},
+                                       int(n_tokens))
+
+    with profiling.span("write"):
+        shards = []
+        for key in sorted(writers):
+            writers[key].close()
+            shards.extend(writers[key].shards)
+
+        splits = {}
+        for shard in shards:
+            stats = splits.setdefault(shard["split"], {"rows": 0, "tokens": 0})
+            stats["rows"] += shard["rows"]
+            stats["tokens"] += shard["tokens"]
+
+        index = {
+            "input_path": input_file,
+            "seed": seed,
+            "validation_fraction": validation_fraction,
+            "split_salt": SPLIT_SALT,
+            "tokenizer": counter.name,
+            "length_bounds": list(LENGTH_BOUNDS),
+            "splits": splits,
+            "shards": shards,
+        }
+        with open(os.path.join(export_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+
+    for split, stats in splits.items():
+        print(f"{split}: {stats['rows']} строк, {stats['tokens']} токенов")
+    print(f"Шардов: {len(shards)}, индекс: {os.path.join(export_dir, 'index.json')}")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перемешивание, train/validation и шарды по длине")
+    parser.add_argument("--input", default=INPUT_PATH)
+    parser.add_argument("--output-dir", default=EXPORT_DIR)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--validation-fraction", type=float, default=VALIDATION_FRACTION)
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling.StageProfiler("export_dataset", enabled=args.profile):
+        export_dataset(args.input, args.output_dir, args.seed, args.validation_fraction)
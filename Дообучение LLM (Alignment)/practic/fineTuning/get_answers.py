@@ -1,30 +1,33 @@
 import os
 import json
 import threading
+import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from dotenv import load_dotenv
-from yandex_cloud_ml_sdk import YCloudML
 from time import sleep
 from random import random
+import sharding
+import profiling
+import backends
 
 # === НАСТРОЙКИ ===
 INPUT_PATH = "output/dataset.jsonl"
 OUTPUT_PATH = "output/output_with_model_responses.jsonl"
-FOLDER_ID = "b1ge6b93hbtf0j5b7ptt"  # Замени на твой folder_id
-MODEL_NAME = "yandexgpt-lite"
+REGENERATED_PATH = "output/regenerated.jsonl"  # выход по умолчанию для другого входа (requeue.jsonl)
 TEMPERATURE = 0.3
 MAX_TOKENS = 1024
 MAX_WORKERS = 8
 RETRY_ATTEMPTS = 2
+SHARD_STAGE = "get_answers"  # поддиректория в sharding.SHARDS_ROOT
+PASSTHROUGH_KEYS = ("chapter_id", "row_id")  # служебные поля для export_dataset и verify_answers
 
 # === Потокобезопасное сохранение ===
 save_lock = threading.Lock()
 
-def save_partial_result(result):
+def save_partial_result(result, output_path=OUTPUT_PATH):
     """Потокобезопасно добавляет результат в JSONL файл."""
     with save_lock:
-        with open(OUTPUT_PATH, "a", encoding="utf-8") as f:
+        with open(output_path, "a", encoding="utf-8") as f:
             f.write(json.dumps(result, ensure_ascii=False) + "\n")
 
 def create_context_aware_prompt(user_question, context_text):
@@ -58,7 +61,8 @@ def extract_context_from_item(item):
         context_parts.append(item["response"])
     return "\n\n".join(context_parts)
 
-def process_item(sdk, item, index):
+def build_answer(backend, item):
+    """Запрашивает ответ модели по контексту элемента, возвращает новую запись."""
     user_question = item["request"][0]["text"]
     context_text = extract_context_from_item(item)
     
@@ -69,12 +73,9 @@ def process_item(sdk, item, index):
     while attempt <= RETRY_ATTEMPTS:
         attempt += 1
         try:
-            model = sdk.chat.completions(MODEL_NAME).configure(
-                temperature=TEMPERATURE, max_tokens=MAX_TOKENS
-            )
             messages = create_context_aware_prompt(user_question, context_text)
-            result = model.run(messages)
-            model_response = result.text if hasattr(result, "text") else str(result)
+            with profiling.span("model"):
+                model_response = backend.complete(messages)
             break
         except Exception as e:
             last_exception = e
@@ -82,50 +83,123 @@ def process_item(sdk, item, index):
             sleep(sleep_time)
             continue
 
-    # Сохраняем только request и response
+    # Сохраняем request и response (+ служебные поля, их убирает export_dataset).
+    # context — исходный фрагмент книги, по нему verify_answers проверяет ответ
     new_item = {
         "request": item["request"],
-        "response": model_response if model_response else item.get("response", "")
+        "response": model_response if model_response else item.get("response", ""),
+        "context": item.get("response", "")
     }
+    for key in PASSTHROUGH_KEYS:
+        if key in item:
+            new_item[key] = item[key]
 
     if last_exception and not model_response:
         new_item["response"] = item.get("response", "")
 
-    save_partial_result(new_item)
+    return new_item
+
+def process_item(backend, item, index, output_path=OUTPUT_PATH):
+    save_partial_result(build_answer(backend, item), output_path)
     return index
 
-def main():
-    load_dotenv()
-    api_key = os.getenv("YANDEX_API")
-    
-    if not api_key:
-        raise ValueError("Ошибка: YANDEX_API не найден в .env файле")
-    
-    sdk = YCloudML(folder_id=FOLDER_ID, auth=api_key)
-    sdk.setup_default_logging()
-    
+def create_backend(name=None):
+    """Бэкенд генерации: yandex, openai или llama_cpp (см. backends.py)."""
+    return backends.create_backend(name, temperature=TEMPERATURE, max_tokens=MAX_TOKENS)
+
+def load_items(input_path=INPUT_PATH):
     # Читаем JSONL файл
     data = []
-    with open(INPUT_PATH, "r", encoding="utf-8") as f:
+    with open(input_path, "r", encoding="utf-8") as f:
         for line in f:
             if line.strip():
                 data.append(json.loads(line))
+    return data
+
+def same_path(a, b):
+    return os.path.abspath(a) == os.path.abspath(b)
+
+def stage_for(input_path=INPUT_PATH):
+    """
+    Поддиректория шардов для входа. У другого входа (requeue.jsonl от
+    verify_answers) свои шарды по хешу содержимого: каждый раунд перегенерации
+    начинается с чистого манифеста, а не с шардов прошлого раунда.
+    """
+    if same_path(input_path, INPUT_PATH):
+        return SHARD_STAGE
+    return f"{SHARD_STAGE}-{sharding.file_fingerprint(input_path)[:12]}"
+
+def main_sharded(worker_id=None, backend_name=None, input_path=INPUT_PATH, stage=SHARD_STAGE):
+    """Шардированный режим: воркер берет шарды через лизы, пока они не кончатся."""
+    backend = create_backend(backend_name)
+    # в памяти только индекс смещений строк, записи читаются по взятому шарду
+    with profiling.span("read"):
+        offsets = sharding.jsonl_line_offsets(input_path)
+    with profiling.span("transform"):
+        sharding.run_worker(
+            stage, input_path, len(offsets),
+            lambda start, stop: sharding.read_jsonl_range(input_path, offsets, start, stop),
+            lambda item: build_answer(backend, item),
+            max_workers=backend.concurrency or MAX_WORKERS, worker_id=worker_id,
+        )
+
+def merge(output_path=OUTPUT_PATH, input_path=INPUT_PATH, stage=SHARD_STAGE):
+    """Собирает шарды в output_path в порядке входа."""
+    with profiling.span("write"):
+        sharding.merge_shards(stage, output_path, output_format="jsonl", input_path=input_path)
+
+def main(backend_name=None, input_path=INPUT_PATH, output_path=OUTPUT_PATH):
+    backend = create_backend(backend_name)
+    with profiling.span("read"):
+        data = load_items(input_path)
     
     print(f"🔹 Найдено {len(data)} элементов для обработки.\n")
     
     # Очищаем выходной файл если он существует
-    if os.path.exists(OUTPUT_PATH):
-        os.remove(OUTPUT_PATH)
+    if os.path.exists(output_path):
+        os.remove(output_path)
     
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(process_item, sdk, item, i): i for i, item in enumerate(data, start=1)}
+    task = profiling.profiled(process_item)
+    with profiling.span("transform"), ThreadPoolExecutor(max_workers=backend.concurrency or MAX_WORKERS) as executor:
+        futures = {executor.submit(task, backend, item, i, output_path): i for i, item in enumerate(data, start=1)}
         for future in tqdm(as_completed(futures), total=len(futures), desc="Обработка элементов", ncols=100):
             try:
                 _ = future.result()
             except Exception as e:
                 print("Ошибка в потоке:", e)
     
-    print(f"\n✅ Все элементы обработаны. Результаты сохранены в {OUTPUT_PATH}")
+    print(f"\n✅ Все элементы обработаны. Результаты сохранены в {output_path}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Генерация ответов модели по контексту")
+    parser.add_argument("--sharded", action="store_true",
+                        help="работать воркером шардированного режима (можно запускать несколько)")
+    parser.add_argument("--worker-id", default=None, help="идентификатор воркера для лиз")
+    parser.add_argument("--merge", action="store_true",
+                        help="собрать готовые шарды в итоговый файл")
+    parser.add_argument("--backend", default=None, choices=sorted(backends.BACKENDS),
+                        help="бэкенд генерации (по умолчанию COMPLETION_BACKEND из .env или yandex)")
+    parser.add_argument("--input", default=INPUT_PATH,
+                        help=f"входной JSONL; для output/requeue.jsonl от verify_answers ответы "
+                             f"пишутся в {REGENERATED_PATH}, основной файл не трогается")
+    parser.add_argument("--output", default=None,
+                        help=f"выходной JSONL (по умолчанию {OUTPUT_PATH}, для другого входа {REGENERATED_PATH})")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    default_input = same_path(args.input, INPUT_PATH)
+    if args.output is None:
+        args.output = OUTPUT_PATH if default_input else REGENERATED_PATH
+    if not default_input and same_path(args.output, OUTPUT_PATH):
+        # main() удалил бы, а merge() заменил бы все принятые ответы только перегенерированными
+        parser.error(f"--output {OUTPUT_PATH} разрешен только для входа {INPUT_PATH}; "
+                     f"перегенерированные ответы подставляет verify_answers.py --merge")
+
+    stage = stage_for(args.input)
+    with profiling.StageProfiler(stage, enabled=args.profile):
+        if args.merge:
+            merge(args.output, args.input, stage)
+        elif args.sharded:
+            main_sharded(args.worker_id, args.backend, args.input, stage)
+        else:
+            main(args.backend, args.input, args.output)
@@ -2,23 +2,24 @@ import os
 import json
 import threading
 import re
+import argparse
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
-from dotenv import load_dotenv
-from yandex_cloud_ml_sdk import YCloudML
 from time import sleep
 from random import random
+import sharding
+import profiling
+import backends
 
 # === НАСТРОЙКИ ===
 INPUT_PATH = "output/qa_prompts_detailed.json"
 OUTPUT_PATH = "practic/fineTuning/output/qa_results_detailed.json"
 
-FOLDER_ID = "b1ge6b93hbtf0j5b7ptt"
-MODEL_NAME = "yandexgpt-lite"
 TEMPERATURE = 0.3
 MAX_TOKENS = 1024
 MAX_WORKERS = 8  # увеличь осторожно если API позволяет
 RETRY_ATTEMPTS = 2  # простые повторы для временных ошибок
+SHARD_STAGE = "get_questions"  # поддиректория в sharding.SHARDS_ROOT
 
 
 # === Потокобезопасное сохранение ===
@@ -138,10 +139,9 @@ def try_extract_questions_from_text(text: str):
 
 
 # === Обработка одного промта (с ретраями и чисткой) ===
-def process_prompt(sdk, item, index):
-    """Обрабатывает один промт, парсит ответ, сохраняет результат немедленно."""
+def build_record(backend, item):
+    """Обрабатывает один промт и парсит ответ, возвращает запись результата."""
     prompt_text = item["prompt"]
-    model = None
 
     attempt = 0
     last_exception = None
@@ -152,15 +152,12 @@ def process_prompt(sdk, item, index):
     while attempt <= RETRY_ATTEMPTS:
         attempt += 1
         try:
-            model = sdk.chat.completions(MODEL_NAME).configure(
-                temperature=TEMPERATURE, max_tokens=MAX_TOKENS
-            )
             messages = [
                 {"role": "system", "text": "Найди ошибки в тексте и исправь их"},
                 {"role": "user", "text": prompt_text},
             ]
-            result = model.run(messages)
-            raw_output = result.text if hasattr(result, "text") else str(result)
+            with profiling.span("model"):
+                raw_output = backend.complete(messages)
             # парсим
             questions, parse_status = try_extract_questions_from_text(raw_output)
             break  # успешно получили ответ (даже если parse failed — мы выйдем и запишем)
@@ -185,28 +182,56 @@ def process_prompt(sdk, item, index):
     if last_exception and not raw_output:
         record["error"] = str(last_exception)
 
-    # Сохраняем результат немедленно
-    save_partial_result(record)
-    return index
+    return record
+
 
+def process_prompt(backend, item, index):
+    """Обрабатывает один промт и сохраняет результат немедленно."""
+    save_partial_result(build_record(backend, item))
+    return index
 
-def main():
-    load_dotenv()
-    api_key = os.getenv("YANDEX_API")
 
-    if not api_key:
-        raise ValueError("Ошибка: YANDEX_API не найден в .env файле")
+def create_backend(name=None):
+    """Бэкенд генерации: yandex, openai или llama_cpp (см. backends.py)."""
+    return backends.create_backend(name, temperature=TEMPERATURE, max_tokens=MAX_TOKENS)
 
-    sdk = YCloudML(folder_id=FOLDER_ID, auth=api_key)
-    sdk.setup_default_logging()
 
+def load_prompts():
     with open(INPUT_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
+        return json.load(f)
+
+
+def main_sharded(worker_id=None, backend_name=None):
+    """Шардированный режим: воркер берет шарды через лизы, пока они не кончатся."""
+    backend = create_backend(backend_name)
+    # JSON-список нельзя прочитать частично, поэтому вход целиком держит каждый воркер
+    with profiling.span("read"):
+        data = load_prompts()
+    with profiling.span("transform"):
+        sharding.run_worker(
+            SHARD_STAGE, INPUT_PATH, len(data),
+            lambda start, stop: data[start:stop],
+            lambda item: build_record(backend, item),
+            max_workers=backend.concurrency or MAX_WORKERS, worker_id=worker_id,
+        )
+
+
+def merge():
+    """Собирает шарды в OUTPUT_PATH в порядке входа."""
+    with profiling.span("write"):
+        sharding.merge_shards(SHARD_STAGE, OUTPUT_PATH, output_format="json", input_path=INPUT_PATH)
+
+
+def main(backend_name=None):
+    backend = create_backend(backend_name)
+    with profiling.span("read"):
+        data = load_prompts()
 
     print(f"🔹 Найдено {len(data)} промтов для обработки.\n")
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(process_prompt, sdk, item, i): i for i, item in enumerate(data, start=1)}
+    task = profiling.profiled(process_prompt)
+    with profiling.span("transform"), ThreadPoolExecutor(max_workers=backend.concurrency or MAX_WORKERS) as executor:
+        futures = {executor.submit(task, backend, item, i): i for i, item in enumerate(data, start=1)}
         for future in tqdm(as_completed(futures), total=len(futures), desc="Обработка промтов", ncols=100):
             try:
                 _ = future.result()
@@ -218,4 +243,21 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Генерация вопросов по промтам")
+    parser.add_argument("--sharded", action="store_true",
+                        help="работать воркером шардированного режима (можно запускать несколько)")
+    parser.add_argument("--worker-id", default=None, help="идентификатор воркера для лиз")
+    parser.add_argument("--merge", action="store_true",
+                        help="собрать готовые шарды в итоговый файл")
+    parser.add_argument("--backend", default=None, choices=sorted(backends.BACKENDS),
+                        help="бэкенд генерации (по умолчанию COMPLETION_BACKEND из .env или yandex)")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling.StageProfiler(SHARD_STAGE, enabled=args.profile):
+        if args.merge:
+            merge()
+        elif args.sharded:
+            main_sharded(args.worker_id, args.backend)
+        else:
+            main(args.backend)
@@ -1,7 +1,10 @@
 import json
 import re
+import hashlib
+import argparse
 from tqdm import tqdm
 from nltk.stem.snowball import SnowballStemmer
+import profiling
 
 input_file = "output/qa_results.json"
 output_file = "output/dataset.jsonl"
@@ -30,19 +33,44 @@ def filter_text(text, keywords, max_sentences=3):
     else:
         return " ".join(sentences[:2])
 
-with open(input_file, 'r', encoding='utf-8') as f:
-    data = json.load(f)
-
-with open(output_file, 'w', encoding='utf-8') as f_out:
-    for item in tqdm(data, desc="Processing items"):
-        questions = item.get("questions", [])
-        answers = item.get("answers", [item.get("source_chunk", "")] * len(questions))
-        
-        for q, a in zip(questions, answers):
-            keywords = extract_keywords(q)
-            short_answer = filter_text(a, keywords)
-            example = {
-                "request": [{"role": "user", "text": q}],
-                "response": short_answer
-            }
-            f_out.write(json.dumps(example, ensure_ascii=False) + "\n")
+def chapter_id(item):
+    """
+    Идентификатор главы чанка: по нему export_dataset делит train/validation.
+    Соседние чанки одной главы перекрываются, поэтому делить по самому чанку нельзя.
+    Без метаданных главы — хеш текста чанка.
+    """
+    metadata = item.get("metadata") or {}
+    if metadata.get("part") or metadata.get("chapter"):
+        return "/".join(metadata.get(k, "") for k in ("book_name", "part", "chapter"))
+    return hashlib.sha1(item.get("source_chunk", "").encode("utf-8")).hexdigest()[:16]
+
+def make_dataset(input_file, output_file):
+    with profiling.span("read"):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+    # фильтрация и запись идут потоково, поэтому это один спан
+    with profiling.span("transform"):
+        with open(output_file, 'w', encoding='utf-8') as f_out:
+            for item in tqdm(data, desc="Processing items"):
+                questions = item.get("questions", [])
+                answers = item.get("answers", [item.get("source_chunk", "")] * len(questions))
+                item_chapter_id = chapter_id(item)
+                
+                for q, a in zip(questions, answers):
+                    keywords = extract_keywords(q)
+                    short_answer = filter_text(a, keywords)
+                    example = {
+                        "request": [{"role": "user", "text": q}],
+                        "response": short_answer,
+                        "chapter_id": item_chapter_id
+                    }
+                    f_out.write(json.dumps(example, ensure_ascii=False) + "\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сборка датасета вопрос-контекст")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling.StageProfiler("make_dataset", enabled=args.profile):
+        make_dataset(input_file, output_file)
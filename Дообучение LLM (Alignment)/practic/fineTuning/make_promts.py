@@ -1,27 +1,13 @@
 import json
+import argparse
 from typing import List, Dict, Any
+import profiling
 
-def create_qa_prompts(input_file: str, output_file: str, prompts_per_chunk: int = 3) -> None:
-    """
-    Создает унифицированные промты для генерации вопросов из чанков.
-    Промты оформлены так, чтобы модель возвращала корректный JSON без лишних пояснений.
-    
-    Args:
-        input_file: путь к файлу с чанками
-        output_file: путь для сохранения промтов
-        prompts_per_chunk: количество разных промтов на один чанк
-    """
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        chunks_data = json.load(f)
-    
-    prompts_dataset = []
-    
-    # Унифицированные шаблоны промтов
-    prompt_templates = [
-        {
-            "name": "factual_questions",
-            "template": """Ты — эксперт по книге "Трое из леса" Юрия Никитина. 
+# Унифицированные шаблоны промтов
+PROMPT_TEMPLATES = [
+    {
+        "name": "factual_questions",
+        "template": """Ты — эксперт по книге "Трое из леса" Юрия Никитина. 
 На основе приведенного отрывка сгенерируй 2-3 фактологических вопроса, ответы на которые однозначно содержатся в тексте.
 
 Отрывок: {text}
@@ -37,10 +23,10 @@ def create_qa_prompts(input_file: str, output_file: str, prompts_per_chunk: int
 {{
   "questions": ["вопрос1", "вопрос2", "вопрос3"]
 }}"""
-        },
-        {
-            "name": "reasoning_questions",
-            "template": """Ты — внимательный читатель книги "Трое из леса". 
+    },
+    {
+        "name": "reasoning_questions",
+        "template": """Ты — внимательный читатель книги "Трое из леса". 
 Проанализируй отрывок и создай 2-3 вопроса, проверяющие понимание причинно-следственных связей и мотивов персонажей.
 
 Отрывок: {text}
@@ -56,10 +42,10 @@ def create_qa_prompts(input_file: str, output_file: str, prompts_per_chunk: int
 {{
   "questions": ["вопрос1", "вопрос2", "вопрос3"]
 }}"""
-        },
-        {
-            "name": "detailed_understanding",
-            "template": """Ты — специалист по творчеству Юрия Никитина. 
+    },
+    {
+        "name": "detailed_understanding",
+        "template": """Ты — специалист по творчеству Юрия Никитина. 
 Создай 2-3 глубоких вопроса по отрывку, проверяющих внимательное прочтение и понимание деталей.
 
 Отрывок: {text}
@@ -75,46 +61,71 @@ def create_qa_prompts(input_file: str, output_file: str, prompts_per_chunk: int
 {{
   "questions": ["вопрос1", "вопрос2", "вопрос3"]
 }}"""
-        }
-    ]
+    }
+]
+
+
+def create_qa_prompts(input_file: str, output_file: str, prompts_per_chunk: int = 3) -> None:
+    """
+    Создает унифицированные промты для генерации вопросов из чанков.
+    Промты оформлены так, чтобы модель возвращала корректный JSON без лишних пояснений.
     
-    for chunk_item in chunks_data:
-        chunk = chunk_item["chunk"]
-        text = chunk["text"]
-        metadata = chunk["metadata"]
-        
-        for i in range(min(prompts_per_chunk, len(prompt_templates))):
-            template = prompt_templates[i]
-            prompt_text = template["template"].format(
-                text=text,
-                metadata=metadata
-            )
-            
-            prompt_data = {
-                "prompt": prompt_text,
-                "metadata": metadata,
-                "prompt_type": template["name"],
-                "source_chunk": text,
-                "expected_format": "json"
-            }
+    Args:
+        input_file: путь к файлу с чанками
+        output_file: путь для сохранения промтов
+        prompts_per_chunk: количество разных промтов на один чанк
+    """
+    
+    with profiling.span("read"):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            chunks_data = json.load(f)
+    
+    prompts_dataset = []
+    
+    with profiling.span("transform"):
+        for chunk_item in chunks_data:
+            chunk = chunk_item["chunk"]
+            text = chunk["text"]
+            metadata = chunk["metadata"]
             
-            prompts_dataset.append(prompt_data)
+            for i in range(min(prompts_per_chunk, len(PROMPT_TEMPLATES))):
+                template = PROMPT_TEMPLATES[i]
+                prompt_text = template["template"].format(
+                    text=text,
+                    metadata=metadata
+                )
+                
+                prompt_data = {
+                    "prompt": prompt_text,
+                    "metadata": metadata,
+                    "prompt_type": template["name"],
+                    "source_chunk": text,
+                    "expected_format": "json"
+                }
+                
+                prompts_dataset.append(prompt_data)
     
     # Сохраняем результат
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(prompts_dataset, f, ensure_ascii=False, indent=2)
+    with profiling.span("write"):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(prompts_dataset, f, ensure_ascii=False, indent=2)
     
     print(f"Создано {len(prompts_dataset)} промтов")
-    print(f"Типы промтов: {[t['name'] for t in prompt_templates[:prompts_per_chunk]]}")
+    print(f"Типы промтов: {[t['name'] for t in PROMPT_TEMPLATES[:prompts_per_chunk]]}")
 
 
 if __name__ == "__main__":
     input_file = "output/troe_iz_lesa_chunks.json"
     output_file = "output/qa_prompts_detailed.json"
     
+    parser = argparse.ArgumentParser(description="Создание промтов для генерации вопросов")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+    
     print("Создаем унифицированные промты...")
-    create_qa_prompts(
-        input_file=input_file,
-        output_file=output_file,
-        prompts_per_chunk=3
-    )
+    with profiling.StageProfiler("make_promts", enabled=args.profile):
+        create_qa_prompts(
+            input_file=input_file,
+            output_file=output_file,
+            prompts_per_chunk=3
+        )
@@ -1,35 +1,91 @@
 import json
 import re
+import argparse
 from bs4 import BeautifulSoup
+import profiling
 
-def extract_text_with_parts(file_path):
-    with open(file_path, 'r', encoding='windows-1251') as file:
-        content = file.read()
-    
-    soup = BeautifulSoup(content, 'html.parser')
-    for tag in soup.find_all(['meta', 'a', 'script', 'style']):
-        tag.decompose()
-    
-    # сохраняем переносы строк между блоками
-    full_text = soup.get_text(separator='\n')
-    
+# Правила разметки книги. Для другой книги передайте свой JSON через --book-config:
+# заданные в нем ключи заменяют значения по умолчанию.
+DEFAULT_BOOK_CONFIG = {
+    "encoding": "windows-1251",
+    # заголовок части, строка целиком
+    "part_pattern": r"\* ЧАСТЬ [А-Я]+ \*",
+    # заголовок главы, строка целиком (подходит "Глава 1" и "Глава 12")
+    "chapter_pattern": r"(?i:Глава\s+\d+\.?)",
+    # строки текста, содержащие любую из фраз, считаются служебными и выбрасываются
+    "stop_phrases": [
+        'Юрий Никитин', 'Copyright', 'http://',
+        'Email:', 'Оригинал', 'Трое из леса'
+    ],
+}
+
+def load_book_config(config_file=None):
+    config = dict(DEFAULT_BOOK_CONFIG)
+    if config_file:
+        with open(config_file, 'r', encoding='utf-8') as file:
+            config.update(json.load(file))
+    return config
+
+def build_line_classifier(config):
+    """
+    Компилирует правила книги в одно регулярное выражение.
+
+    match() по строке дает lastgroup "part", "chapter" или "meta" (служебная
+    строка), либо None для обычного текста — одна проверка на строку вместо
+    отдельных проходов по каждому правилу.
+    """
+    meta = '|'.join(re.escape(phrase) for phrase in config["stop_phrases"]) or r'(?!)'
+    return re.compile(
+        rf'(?P<part>{config["part_pattern"]})$'
+        rf'|(?P<chapter>{config["chapter_pattern"]})$'
+        rf'|.*?(?P<meta>{meta})'
+    )
+
+def normalize_text(full_text):
+    """Чистит текст целиком, а не построчно: остатки тегов, CRLF и пробелы."""
     # удаляем остаточные "<...>" если они попали в текст и нормализуем CRLF
     full_text = re.sub(r'</?[^>]+>', '', full_text)
     full_text = full_text.replace('\r\n', '\n').replace('\r', '\n')
-    
     # Убираем лишние пробелы внутри строк, но НЕ трогаем разделение на строки
-    lines = [re.sub(r'\s+', ' ', line).strip() for line in full_text.split('\n')]
-    # Оставляем только непустые строки (но сохраняем структуру)
-    lines = [line for line in lines if line]
+    return re.sub(r'[^\S\n]+', ' ', full_text)
+
+def extract_text_with_parts(file_path, config=None):
+    config = config or DEFAULT_BOOK_CONFIG
+    
+    with profiling.span("read"):
+        with open(file_path, 'r', encoding=config["encoding"]) as file:
+            content = file.read()
+    
+    with profiling.span("parse"):
+        soup = BeautifulSoup(content, 'html.parser')
+        for tag in soup.find_all(['meta', 'a', 'script', 'style']):
+            tag.decompose()
+        
+        # сохраняем переносы строк между блоками
+        full_text = soup.get_text(separator='\n')
+    
+    with profiling.span("transform"):
+        return split_parts(full_text, config)
+
+def split_parts(full_text, config=None):
+    classify = build_line_classifier(config or DEFAULT_BOOK_CONFIG).match
     
     parts = []
     current_part = None
     current_chapter = None
     current_content = []
     
-    for text in lines:
+    for line in normalize_text(full_text).split('\n'):
+        text = line.strip()
+        # Оставляем только непустые строки (но сохраняем структуру)
+        if not text:
+            continue
+        
+        match = classify(text)
+        kind = match.lastgroup if match else None
+        
         # ЧАСТЬ
-        if re.match(r'^\* ЧАСТЬ [А-Я]+ \*$', text):
+        if kind == "part":
             if current_part and current_part["chapters"]:
                 parts.append(current_part)
             current_part = {"part": text.replace('*', '').strip(), "chapters": []}
@@ -37,8 +93,8 @@ def extract_text_with_parts(file_path):
             current_content = []
             continue
 
-        # ГЛАВА (подходит "Глава 1" и "Глава 12")
-        if re.match(r'^Глава\s+\d+\.?$', text, flags=re.IGNORECASE):
+        # ГЛАВА
+        if kind == "chapter":
             if current_chapter and current_content and current_part is not None:
                 chapter_text = '\n'.join(current_content).strip()
                 if chapter_text:
@@ -51,12 +107,8 @@ def extract_text_with_parts(file_path):
             continue
 
         # ТЕКСТ ГЛАВЫ
-        if current_part and current_chapter:
-            if not any(meta in text for meta in [
-                'Юрий Никитин', 'Copyright', 'http://',
-                'Email:', 'Оригинал', 'Трое из леса'
-            ]):
-                current_content.append(text)
+        if current_part and current_chapter and kind != "meta":
+            current_content.append(text)
 
     # сохраняем последнюю главу и часть
     if current_chapter and current_content and current_part is not None:
@@ -72,8 +124,9 @@ def extract_text_with_parts(file_path):
     return parts
 
 def save_to_json(parts, output_file):
-    with open(output_file, 'w', encoding='utf-8') as file:
-        json.dump(parts, file, ensure_ascii=False, indent=2)
+    with profiling.span("write"):
+        with open(output_file, 'w', encoding='utf-8') as file:
+            json.dump(parts, file, ensure_ascii=False, indent=2)
 
 def print_json_structure(json_file):
     with open(json_file, 'r', encoding='utf-8') as file:
@@ -96,9 +149,16 @@ if __name__ == "__main__":
     input_file = "input/Troe_iz_lesa.htm"
     output_file = "output/troe_iz_lesa.json"
     
+    parser = argparse.ArgumentParser(description="Извлечение частей и глав из HTML книги")
+    parser.add_argument("--book-config", default=None,
+                        help="JSON с encoding, part_pattern, chapter_pattern, stop_phrases")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+    
     try:
-        parts = extract_text_with_parts(input_file)
-        save_to_json(parts, output_file)
+        with profiling.StageProfiler("parsing", enabled=args.profile):
+            parts = extract_text_with_parts(input_file, load_book_config(args.book_config))
+            save_to_json(parts, output_file)
         
         total_parts = len(parts)
         total_chapters = sum(len(part["chapters"]) for part in parts)
@@ -1,6 +1,12 @@
 import json
 import re
+import argparse
 from typing import List, Dict, Any
+import profiling
+
+CHUNKING_CONFIG_PATH = "./output/chunking_config.json"  # пишет analytics.py
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_OVERLAP = 50  # 10% перекрытия
 
 def split_text_into_chunks(text: str, chunk_size: int = 512, overlap: int = 50) -> List[str]:
     """
@@ -89,9 +95,22 @@ def create_chunks_dataset(input_file: str, output_file: str, chunk_size: int = 5
     """
     
     # Чтение исходного файла
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with profiling.span("read"):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    
+    with profiling.span("transform"):
+        chunks_dataset = _build_chunks(data, chunk_size, overlap)
     
+    # Сохранение результата
+    with profiling.span("write"):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(chunks_dataset, f, ensure_ascii=False, indent=2)
+    
+    print(f"Создано {len(chunks_dataset)} чанков")
+    print(f"Результат сохранен в: {output_file}")
+
+def _build_chunks(data: List[Dict[str, Any]], chunk_size: int, overlap: int) -> List[Dict[str, Any]]:
     chunks_dataset = []
     
     for part_data in data:
@@ -125,56 +144,39 @@ def create_chunks_dataset(input_file: str, output_file: str, chunk_size: int = 5
                 }
                 chunks_dataset.append(chunk_data)
     
-    # Сохранение результата
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(chunks_dataset, f, ensure_ascii=False, indent=2)
-    
-    print(f"Создано {len(chunks_dataset)} чанков")
-    print(f"Результат сохранен в: {output_file}")
+    return chunks_dataset
 
-def analyze_dataset(input_file: str) -> None:
+def load_chunking_config(config_file: str = CHUNKING_CONFIG_PATH) -> Dict[str, int]:
     """
-    Анализирует исходный датасет для подбора оптимальных параметров
+    Читает параметры нарезки, подобранные analytics.py.
+    Если конфига нет — используются значения по умолчанию.
     """
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    total_chapters = 0
-    total_text_length = 0
-    chapter_lengths = []
-    
-    for part_data in data:
-        chapters = part_data.get("chapters", [])
-        total_chapters += len(chapters)
-        
-        for chapter_data in chapters:
-            text = chapter_data.get("text", "")
-            words = len(text.split())
-            chapter_lengths.append(words)
-            total_text_length += words
-    
-    print("=== Анализ датасета ===")
-    print(f"Количество частей: {len(data)}")
-    print(f"Количество глав: {total_chapters}")
-    print(f"Общее количество слов: {total_text_length}")
-    print(f"Средняя длина главы: {total_text_length/total_chapters:.0f} слов")
-    print(f"Минимальная длина главы: {min(chapter_lengths)} слов")
-    print(f"Максимальная длина главы: {max(chapter_lengths)} слов")
-    print(f"Медианная длина главы: {sorted(chapter_lengths)[len(chapter_lengths)//2]} слов")
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        print(f"Конфиг {config_file} не найден, используем chunk_size={DEFAULT_CHUNK_SIZE}, overlap={DEFAULT_OVERLAP}")
+        return {"chunk_size": DEFAULT_CHUNK_SIZE, "overlap": DEFAULT_OVERLAP}
+    
+    print(f"Параметры из {config_file}: chunk_size={config['chunk_size']}, overlap={config['overlap']}")
+    return {"chunk_size": config["chunk_size"], "overlap": config["overlap"]}
 
 if __name__ == "__main__":
     input_file = "./output/troe_iz_lesa.json"
     output_file = "./output/troe_iz_lesa_chunks.json"
     
-    # Сначала анализируем данные
-    print("Анализируем исходные данные...")
-    analyze_dataset(input_file)
-    
-    # Создаем чанки с оптимальными параметрами
-    print("\nСоздаем чанки...")
-    create_chunks_dataset(
-        input_file=input_file,
-        output_file=output_file,
-        chunk_size=500,  # Можно настроить based на анализе
-        overlap=50       # 10% перекрытия
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Разбиение глав на чанки")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+    
+    with profiling.StageProfiler("processing", enabled=args.profile):
+        # Параметры подбираются заранее: python analytics.py
+        config = load_chunking_config()
+        
+        print("\nСоздаем чанки...")
+        create_chunks_dataset(
+            input_file=input_file,
+            output_file=output_file,
+            chunk_size=config["chunk_size"],
+            overlap=config["overlap"]
+        )
\ No newline at end of file
@@ -0,0 +1,204 @@
+import os
+import io
+import json
+import time
+import socket
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# === НАСТРОЙКИ ===
+PROFILE_DIR = "output/profiles"
+TOP_FUNCTIONS = 25  # сколько функций печатать в отчете
+
+# активный профайлер этапа; span() без него ничего не делает
+_active = None
+
+
+class StageProfiler:
+    """
+    Профилирование одного этапа пайплайна.
+
+    Пишет в PROFILE_DIR файлы <stage>.<host>.<pid>.* — у каждого шардированного
+    воркера и у --merge свои:
+        .prof       — детерминированный профиль cProfile (snakeviz, pstats)
+        .txt        — таблица времени по функциям
+        .trace.json — спаны этапа в формате Chrome Trace
+                      (chrome://tracing, Perfetto, speedscope)
+    и печатает пиковую память по tracemalloc.
+
+    cProfile видит только поток, в котором запущен этап. Задачи пулов потоков
+    нужно оборачивать в profiled(): каждый поток получает свой профайлер,
+    и при сохранении все они сливаются в один профиль.
+
+    memory_peak_mb спана — пик внутри спана. Память tracemalloc общая для
+    процесса, поэтому у спанов в потоках пик включает и соседние потоки.
+    """
+
+    def __init__(self, stage: str, enabled: bool = True, output_dir: str = PROFILE_DIR,
+                 top: int = TOP_FUNCTIONS):
+        self.stage = stage
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.top = top
+        self._events = []
+        self._lock = threading.Lock()
+        self._profile = None
+        self._thread_profiles = []
+        self._local = threading.local()
+        self._open_peaks = {}  # id открытого спана -> пик памяти внутри него
+        self._stage_peak = 0
+        self._t0 = 0.0
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._t0) * 1e6
+
+    def record(self, name: str, start_us: float, end_us: float, args: dict = None) -> None:
+        event = {
+            "name": name,
+            "cat": self.stage,
+            "ph": "X",
+            "ts": start_us,
+            "dur": end_us - start_us,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._events.append(event)
+
+    def _fold_peak(self) -> int:
+        """
+        Разносит пик tracemalloc по всем открытым спанам и сбрасывает его,
+        чтобы следующий спан видел пик только со своего начала.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        for key in self._open_peaks:
+            self._open_peaks[key] = max(self._open_peaks[key], peak)
+        self._stage_peak = max(self._stage_peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    @contextmanager
+    def span(self, name: str):
+        key = object()
+        with self._lock:
+            current = self._fold_peak()
+            self._open_peaks[key] = current
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            end = self._now_us()
+            with self._lock:
+                current = self._fold_peak()
+                peak = self._open_peaks.pop(key)
+            self.record(name, start, end,
+                        {"memory_current_mb": current / 2 ** 20, "memory_peak_mb": peak / 2 ** 20})
+
+    def wrap(self, fn):
+        """Задача пула потоков под отдельным cProfile своего потока."""
+        def wrapper(*args, **kwargs):
+            profile = getattr(self._local, "profile", None)
+            if profile is None:
+                profile = self._local.profile = cProfile.Profile()
+                with self._lock:
+                    self._thread_profiles.append(profile)
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+: профайлер этапа через sys.monitoring уже видит все потоки
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+        return wrapper
+
+    def __enter__(self):
+        global _active
+        if not self.enabled:
+            return self
+        tracemalloc.start()
+        self._t0 = time.perf_counter()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        _active = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        if not self.enabled:
+            return False
+        self._profile.disable()
+        _active = None
+        with self._lock:
+            self._fold_peak()
+        peak = self._stage_peak
+        tracemalloc.stop()
+        self.record(self.stage, 0.0, self._now_us(), {"memory_peak_mb": peak / 2 ** 20})
+        self._save(peak)
+        return False
+
+    def _save(self, peak: int) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.stage}.{socket.gethostname()}.{os.getpid()}")
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=buffer)
+        for profile in self._thread_profiles:
+            profile.create_stats()
+            if profile.stats:
+                stats.add(profile)
+        stats.dump_stats(f"{base}.prof")
+        stats.sort_stats("cumulative").print_stats(self.top)
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(buffer.getvalue())
+
+        with open(f"{base}.trace.json", "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self._events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+        # суммируем спаны по имени: спаны из потоков (model) повторяются сотни раз
+        totals = {}
+        for event in sorted(self._events, key=lambda e: e["ts"]):
+            if event["name"] != self.stage:
+                count, duration = totals.get(event["name"], (0, 0.0))
+                totals[event["name"]] = (count + 1, duration + event["dur"])
+
+        print(f"\n=== Профиль этапа {self.stage} ===")
+        for name, (count, duration) in totals.items():
+            print(f"  {name:<12} {duration / 1e3:10.1f} мс  x{count}")
+        print(f"  {'всего':<12} {self._now_us() / 1e3:10.1f} мс")
+        print(f"Пиковая память (tracemalloc): {peak / 2 ** 20:.1f} МБ")
+        if self._thread_profiles:
+            print(f"Профили потоков: {len(self._thread_profiles)}, объединены с основным")
+        print(buffer.getvalue())
+        print(f"Профиль: {base}.prof, трейс: {base}.trace.json")
+
+
+@contextmanager
+def span(name: str):
+    """Спан этапа (read, parse, transform, write). Без --profile ничего не делает."""
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    with profiler.span(name):
+        yield
+
+
+def profiled(fn):
+    """
+    Оборачивает задачу для ThreadPoolExecutor, чтобы ее функции попали
+    в профиль этапа. Без --profile возвращает fn как есть.
+    """
+    profiler = _active
+    return fn if profiler is None else profiler.wrap(fn)
+
+
+def add_profile_argument(parser) -> None:
+    parser.add_argument("--profile", action="store_true",
+                        help=f"профилировать этап (cProfile, трейс спанов, tracemalloc) в {PROFILE_DIR}")
@@ -0,0 +1,382 @@
+import os
+import json
+import socket
+import hashlib
+import threading
+import time
+import uuid
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+
+# === НАСТРОЙКИ ===
+SHARDS_ROOT = "output/shards"
+SHARD_SIZE = 50          # элементов в одном шарде
+LEASE_TTL = 300          # через сколько секунд без heartbeat лиза считается брошенной
+HEARTBEAT_INTERVAL = 30  # как часто владелец продлевает лизу
+IDLE_SLEEP = 10          # пауза, если все свободные шарды заняты другими воркерами
+
+
+def default_worker_id() -> str:
+    """Уникальный идентификатор воркера: хост + pid + случайный суффикс."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def stage_paths(stage: str, root: str = SHARDS_ROOT) -> dict:
+    """Пути рабочей директории этапа: манифест, лизы и выходные шарды."""
+    stage_dir = os.path.join(root, stage)
+    return {
+        "stage_dir": stage_dir,
+        "manifest": os.path.join(stage_dir, "manifest.json"),
+        "leases": os.path.join(stage_dir, "leases"),
+        "results": os.path.join(stage_dir, "results"),
+    }
+
+
+def shard_name(shard_id: int) -> str:
+    return f"shard_{shard_id:05d}"
+
+
+def shard_count(n_items: int, shard_size: int) -> int:
+    return (n_items + shard_size - 1) // shard_size
+
+
+def _result_path(paths: dict, shard_id: int) -> str:
+    return os.path.join(paths["results"], f"{shard_name(shard_id)}.jsonl")
+
+
+def file_fingerprint(path: str) -> str:
+    """sha1 содержимого файла (читается потоково)."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ensure_manifest(paths: dict, input_path: str, n_items: int, shard_size: int) -> dict:
+    """
+    Создает манифест этапа (атомарно, первым воркером) или проверяет существующий.
+
+    Все воркеры обязаны резать один и тот же вход одинаково, иначе шарды
+    перекроются или подмешаются результаты старого входа — поэтому любое
+    расхождение с манифестом (в том числе по содержимому входа) считается ошибкой.
+    """
+    os.makedirs(paths["leases"], exist_ok=True)
+    os.makedirs(paths["results"], exist_ok=True)
+
+    manifest = {
+        "input_path": os.path.abspath(input_path),
+        "input_sha1": file_fingerprint(input_path),
+        "n_items": n_items,
+        "shard_size": shard_size,
+        "n_shards": shard_count(n_items, shard_size),
+    }
+
+    tmp_path = f"{paths['manifest']}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    try:
+        # link не перезаписывает существующий файл — побеждает ровно один воркер
+        os.link(tmp_path, paths["manifest"])
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(tmp_path)
+
+    with open(paths["manifest"], "r", encoding="utf-8") as f:
+        existing = json.load(f)
+
+    keys = ("input_sha1", "n_items", "shard_size")
+    if any(existing.get(key) != manifest[key] for key in keys):
+        raise ValueError(
+            f"Манифест {paths['manifest']} не совпадает со входом {input_path}: "
+            f"{[existing.get(key) for key in keys]} против {[manifest[key] for key in keys]}. "
+            f"Удалите {paths['stage_dir']} чтобы начать заново."
+        )
+    return existing
+
+
+# === Чтение входа по шардам ===
+def jsonl_line_offsets(path: str) -> array:
+    """Байтовые смещения непустых строк JSONL — индекс вместо загрузки всех записей."""
+    offsets = array("q")
+    with open(path, "rb") as f:
+        position = 0
+        for line in f:
+            if line.strip():
+                offsets.append(position)
+            position += len(line)
+    return offsets
+
+
+def read_jsonl_range(path: str, offsets: array, start: int, stop: int) -> list:
+    """Читает записи [start, stop) JSONL по индексу смещений."""
+    items = []
+    with open(path, "rb") as f:
+        f.seek(offsets[start])
+        for line in f:
+            if len(items) >= stop - start:
+                break
+            if line.strip():
+                items.append(json.loads(line))
+    return items
+
+
+# === Лизы ===
+def _read_lease(lease_path: str):
+    try:
+        with open(lease_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _lease_age(lease_path: str):
+    try:
+        return time.time() - os.stat(lease_path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _create_lease(lease_path: str, token: str, worker_id: str) -> bool:
+    """Атомарно создает файл лизы (O_EXCL). False — если лиза уже есть."""
+    try:
+        fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"token": token, "worker": worker_id, "created": time.time()}, f)
+    return True
+
+
+def _break_stale_lease(lease_path: str, ttl: float) -> None:
+    """
+    Снимает просроченную лизу упавшего воркера.
+
+    Файл сначала переименовывается в уникальное имя (rename атомарен, удастся
+    только одному), затем проверяется, что это та самая просроченная лиза —
+    если между проверкой и rename ее успел пересоздать другой воркер,
+    она возвращается на место через link (не перезаписывает чужую).
+    """
+    age = _lease_age(lease_path)
+    if age is None or age < ttl:
+        return
+    stale = _read_lease(lease_path)
+
+    graveyard = f"{lease_path}.{uuid.uuid4().hex}.stale"
+    try:
+        os.rename(lease_path, graveyard)
+    except FileNotFoundError:
+        return
+
+    taken = _read_lease(graveyard)
+    if stale is not None and taken is not None and taken.get("token") != stale.get("token"):
+        try:
+            os.link(graveyard, lease_path)
+        except FileExistsError:
+            pass
+    os.remove(graveyard)
+
+
+class Lease:
+    """Лиза на один шард с фоновым heartbeat (обновление mtime файла)."""
+
+    def __init__(self, lease_path: str, token: str, interval: float = HEARTBEAT_INTERVAL):
+        self.lease_path = lease_path
+        self.token = token
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+
+    def _owned(self) -> bool:
+        lease = _read_lease(self.lease_path)
+        return lease is not None and lease.get("token") == self.token
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.interval):
+            if not self._owned():
+                # лизу забрали (например, процесс надолго завис) — результат не пишем
+                self.lost = True
+                return
+            try:
+                os.utime(self.lease_path)
+            except FileNotFoundError:
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        if self._owned():
+            os.remove(self.lease_path)
+        else:
+            self.lost = True
+        return False
+
+
+def try_claim_shard(paths: dict, shard_id: int, worker_id: str, ttl: float = LEASE_TTL):
+    """Пытается взять шард в работу. Возвращает Lease или None."""
+    if os.path.exists(_result_path(paths, shard_id)):
+        return None
+
+    lease_path = os.path.join(paths["leases"], f"{shard_name(shard_id)}.lease")
+    _break_stale_lease(lease_path, ttl)
+
+    token = uuid.uuid4().hex
+    if not _create_lease(lease_path, token, worker_id):
+        return None
+
+    # шард мог быть завершен между проверкой результата и созданием лизы
+    if os.path.exists(_result_path(paths, shard_id)):
+        os.remove(lease_path)
+        return None
+    return Lease(lease_path, token)
+
+
+def write_shard_result(paths: dict, shard_id: int, records) -> None:
+    """Атомарно публикует выход шарда: пишем во временный файл и переименовываем."""
+    final_path = _result_path(paths, shard_id)
+    tmp_path = f"{final_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, final_path)
+
+
+def pending_shards(paths: dict, n_shards: int):
+    return [i for i in range(n_shards) if not os.path.exists(_result_path(paths, i))]
+
+
+# === Воркер ===
+def run_worker(stage: str, input_path: str, n_items: int, load_shard, process_fn,
+               max_workers: int = 8, shard_size: int = SHARD_SIZE,
+               worker_id: str = None, root: str = SHARDS_ROOT) -> int:
+    """
+    Обрабатывает шарды этапа, пока не останется незавершенных.
+
+    load_shard(start, stop) -> список элементов [start, stop) входа; так воркер
+    держит в памяти только взятый шард. process_fn(item) -> record вызывается
+    в пуле потоков; внутри шарда записи сохраняются в порядке входа. Можно
+    запускать сколько угодно воркеров на одной или нескольких машинах с общей
+    файловой системой.
+
+    Returns:
+        Количество шардов, обработанных этим воркером
+    """
+    worker_id = worker_id or default_worker_id()
+    paths = stage_paths(stage, root)
+    manifest = ensure_manifest(paths, input_path, n_items, shard_size)
+    n_shards = manifest["n_shards"]
+    done = 0
+
+    print(f"🔹 Воркер {worker_id}: {n_items} элементов, {n_shards} шардов по {shard_size}.\n")
+
+    task = profiling.profiled(process_fn)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            pending = pending_shards(paths, n_shards)
+            if not pending:
+                break
+
+            claimed = False
+            for shard_id in pending:
+                lease = try_claim_shard(paths, shard_id, worker_id)
+                if lease is None:
+                    continue
+                claimed = True
+
+                start = shard_id * shard_size
+                shard_items = load_shard(start, min(start + shard_size, n_items))
+                with lease:
+                    # map сохраняет порядок входа
+                    records = list(executor.map(task, shard_items))
+                    if not lease.lost:
+                        write_shard_result(paths, shard_id, records)
+
+                if lease.lost:
+                    print(f"⚠️ Лиза на {shard_name(shard_id)} потеряна, шард остается другим воркерам")
+                    continue
+                done += 1
+                print(f"✅ {shard_name(shard_id)} готов ({len(records)} записей)")
+
+            if not claimed:
+                # остальные шарды в работе у других воркеров — ждем, вдруг кто-то упадет
+                time.sleep(IDLE_SLEEP)
+
+    print(f"\n✅ Воркер {worker_id} завершил работу, обработано шардов: {done}")
+    return done
+
+
+# === Слияние ===
+def iter_merged_records(stage: str, root: str = SHARDS_ROOT, input_path: str = None):
+    """
+    Итерирует записи всех шардов в порядке входа.
+    Если передан input_path, шарды должны быть посчитаны именно по нему.
+    """
+    paths = stage_paths(stage, root)
+    with open(paths["manifest"], "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    if input_path is not None and manifest.get("input_sha1") != file_fingerprint(input_path):
+        raise ValueError(
+            f"Шарды {paths['stage_dir']} посчитаны по другой версии {input_path}. "
+            f"Удалите директорию и запустите воркеры заново."
+        )
+
+    missing = pending_shards(paths, manifest["n_shards"])
+    if missing:
+        raise RuntimeError(
+            f"Не все шарды готовы: осталось {len(missing)} "
+            f"(например, {shard_name(missing[0])})"
+        )
+
+    for i in range(manifest["n_shards"]):
+        with open(_result_path(paths, i), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def merge_shards(stage: str, output_path: str, output_format: str = "jsonl",
+                 root: str = SHARDS_ROOT, input_path: str = None) -> int:
+    """
+    Собирает выходы шардов в итоговый файл в порядке входа.
+
+    Args:
+        stage: имя этапа (поддиректория в root)
+        output_path: итоговый файл
+        output_format: "jsonl" или "json" (список, как у get_questions)
+        input_path: вход этапа — проверяется, что шарды посчитаны по нему
+
+    Returns:
+        Количество записей
+    """
+    if output_format not in ("json", "jsonl"):
+        raise ValueError(f"Неизвестный формат: {output_format}")
+
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    count = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if output_format == "json":
+                records = list(iter_merged_records(stage, root, input_path))
+                json.dump(records, f, ensure_ascii=False, indent=2)
+                count = len(records)
+            else:
+                for record in iter_merged_records(stage, root, input_path):
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    print(f"✅ Слито {count} записей в {output_path}")
+    return count
@@ -0,0 +1,262 @@
+import os
+import re
+import json
+import argparse
+from functools import lru_cache
+from typing import List, Dict, Any
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import profiling
+from make_dataset import stemmer
+
+# === НАСТРОЙКИ ===
+ANSWERS_PATH = "output/output_with_model_responses.jsonl"
+REQUEUE_PATH = "output/requeue.jsonl"          # вход для get_answers --input
+REPORT_PATH = "output/verification_report.json"
+BATCH_SIZE = 2048
+MIN_WORD_LEN = 3  # как в make_dataset.extract_keywords: предлоги и союзы не считаем
+SUPPORT_THRESHOLD = 0.4
+FEATURE_KINDS = ("lexical", "stem", "stem_bigram")
+FEATURE_WEIGHTS = np.array([0.2, 0.4, 0.4])
+NOT_REQUEUED = ("no_context", "unscorable")  # причины, которые повторная генерация не исправит
+REFUSAL_RE = re.compile(r'нет информации|не содержит информации|не упоминается', re.IGNORECASE)
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    return stemmer.stem(word)
+
+
+def extract_features(text: str):
+    """Множества признаков ответа/контекста: слова, основы и биграммы основ."""
+    words = [w for w in re.findall(r'\w+', text.lower()) if len(w) >= MIN_WORD_LEN]
+    stems = [stem(w) for w in words]
+    return set(words), set(stems), {f"{a} {b}" for a, b in zip(stems, stems[1:])}
+
+
+def _binary_matrix(rows: List[set], vocab: Dict[str, int], grow: bool) -> List[List[int]]:
+    indices = []
+    for features in rows:
+        row = []
+        for feature in features:
+            col = vocab.get(feature)
+            if col is None and grow:
+                col = vocab[feature] = len(vocab)
+            if col is not None:
+                row.append(col)
+        indices.append(row)
+    return indices
+
+
+def _to_csr(indices: List[List[int]], n_cols: int) -> csr_matrix:
+    indptr = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in indices], out=indptr[1:])
+    flat = np.fromiter((c for row in indices for c in row), dtype=np.int64, count=int(indptr[-1]))
+    return csr_matrix((np.ones(len(flat), dtype=np.float32), flat, indptr), shape=(len(indices), n_cols))
+
+
+def score_batch(answers: List[str], contexts: List[str]) -> np.ndarray:
+    """
+    Доля признаков ответа, встречающихся в его контексте, для каждого вида признаков.
+
+    Ответы и контексты батча кодируются бинарными разреженными матрицами в общем
+    словаре; пересечение для всех пар считается одним поэлементным произведением.
+
+    Returns:
+        Массив (n, len(FEATURE_KINDS)); NaN — у ответа нет признаков этого вида
+    """
+    n = len(answers)
+    answer_features = [extract_features(a) for a in answers]
+    context_features = [extract_features(c) for c in contexts]
+    scores = np.full((n, len(FEATURE_KINDS)), np.nan)
+
+    for k in range(len(FEATURE_KINDS)):
+        vocab = {}
+        # признаки контекста, которых нет ни в одном ответе, на пересечение не влияют
+        answer_idx = _binary_matrix([f[k] for f in answer_features], vocab, grow=True)
+        context_idx = _binary_matrix([f[k] for f in context_features], vocab, grow=False)
+        answers_m = _to_csr(answer_idx, len(vocab))
+        contexts_m = _to_csr(context_idx, len(vocab))
+
+        overlap = np.asarray(answers_m.multiply(contexts_m).sum(axis=1)).ravel()
+        total = np.asarray(answers_m.sum(axis=1)).ravel()
+        np.divide(overlap, total, out=scores[:, k], where=total > 0)
+    return scores
+
+
+def combine_scores(scores: np.ndarray) -> np.ndarray:
+    """Взвешенное среднее по доступным видам признаков."""
+    available = ~np.isnan(scores)
+    weights = FEATURE_WEIGHTS * available
+    weighted = np.where(available, scores, 0.0) @ FEATURE_WEIGHTS
+    total = weights.sum(axis=1)
+    return np.divide(weighted, total, out=np.zeros(len(scores)), where=total > 0)
+
+
+def all_words_in_context(answer: str, context: str) -> bool:
+    """Короткий ответ без признаков ("Да.") принимается, если все его слова есть в контексте."""
+    words = set(re.findall(r'\w+', answer.lower()))
+    return bool(words) and words <= set(re.findall(r'\w+', context.lower()))
+
+
+def flag_rows(rows: List[Dict[str, Any]], scores: np.ndarray, support: np.ndarray) -> List[str]:
+    """Причина отбраковки для каждой строки или "" если ответ принят."""
+    reasons = []
+    for row, row_scores, score in zip(rows, scores, support):
+        answer = row.get("response", "").strip()
+        context = row.get("context")
+        if context is None:
+            reasons.append("no_context")    # старая выгрузка: проверить нечем
+        elif not answer:
+            reasons.append("empty")
+        elif answer == context.strip():
+            reasons.append("not_generated")  # get_answers оставил контекст после ошибок модели
+        elif REFUSAL_RE.search(answer):
+            reasons.append("refusal")
+        elif np.isnan(row_scores).all():
+            # нет слов от MIN_WORD_LEN букв: оценка не определена, это не "unsupported"
+            reasons.append("" if all_words_in_context(answer, context) else "unscorable")
+        elif score < SUPPORT_THRESHOLD:
+            reasons.append("unsupported")
+        else:
+            reasons.append("")
+    return reasons
+
+
+def verify_rows(rows: List[Dict[str, Any]]):
+    scores = score_batch([r.get("response", "") for r in rows], [r.get("context") or "" for r in rows])
+    support = combine_scores(scores)
+    return scores, support, flag_rows(rows, scores, support)
+
+
+def iter_batches(path: str, batch_size: int = BATCH_SIZE):
+    """Читает JSONL батчами; row_id — номер строки в файле."""
+    batch = []
+    with open(path, "r", encoding="utf-8") as f:
+        row_id = 0
+        for line in f:
+            if not line.strip():
+                continue
+            batch.append((row_id, json.loads(line)))
+            row_id += 1
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def requeue_item(row_id: int, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Строка в формате dataset.jsonl для повторного прогона get_answers."""
+    item = {"request": row["request"], "response": row["context"], "row_id": row_id}
+    if "chapter_id" in row:
+        item["chapter_id"] = row["chapter_id"]
+    return item
+
+
+def verify(answers_path: str = ANSWERS_PATH, requeue_path: str = REQUEUE_PATH,
+           report_path: str = REPORT_PATH) -> Dict[str, Any]:
+    """
+    Оценивает все ответы и пишет в requeue_path только отбракованные,
+    кроме NOT_REQUEUED: у no_context нет контекста для повторной генерации,
+    unscorable (короткий ответ со словами не из контекста) проверяется вручную.
+    """
+    reasons_count = {}
+    all_support = []
+    requeued = 0
+
+    with open(requeue_path, "w", encoding="utf-8") as f_out:
+        for batch in iter_batches(answers_path):
+            with profiling.span("transform"):
+                rows = [row for _, row in batch]
+                _, support, reasons = verify_rows(rows)
+            all_support.append(support)
+
+            with profiling.span("write"):
+                for (row_id, row), reason in zip(batch, reasons):
+                    reasons_count[reason or "ok"] = reasons_count.get(reason or "ok", 0) + 1
+                    if reason and reason not in NOT_REQUEUED:
+                        f_out.write(json.dumps(requeue_item(row_id, row), ensure_ascii=False) + "\n")
+                        requeued += 1
+
+    support = np.concatenate(all_support) if all_support else np.zeros(0)
+    counts, edges = np.histogram(support, bins=10, range=(0, 1))
+    report = {
+        "answers_path": answers_path,
+        "rows": int(len(support)),
+        "requeued": requeued,
+        "reasons": reasons_count,
+        "support_threshold": SUPPORT_THRESHOLD,
+        "support_histogram": {f"{lo:.1f}-{hi:.1f}": int(c) for c, lo, hi in zip(counts, edges[:-1], edges[1:])},
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"Проверено {report['rows']} ответов: {reasons_count}")
+    print(f"На повторную генерацию: {requeued} -> {requeue_path}")
+    if requeued:
+        print(f"Дальше: python get_answers.py --input {requeue_path} --output output/regenerated.jsonl")
+        print("        python verify_answers.py --merge output/regenerated.jsonl")
+    return report
+
+
+def merge_regenerated(regenerated_path: str, answers_path: str = ANSWERS_PATH) -> int:
+    """
+    Подставляет перегенерированные ответы на место исходных по row_id.
+    Заменяются только ответы, прошедшие проверку; остальные можно снова
+    отправить на генерацию повторным запуском verify.
+    """
+    with profiling.span("read"):
+        regenerated = []
+        for batch in iter_batches(regenerated_path):
+            regenerated.extend(row for _, row in batch)
+
+    with profiling.span("transform"):
+        replacements = {}
+        without_id = sum(1 for row in regenerated if "row_id" not in row)
+        regenerated = [row for row in regenerated if "row_id" in row]
+        if regenerated:
+            _, _, reasons = verify_rows(regenerated)
+            for row, reason in zip(regenerated, reasons):
+                if not reason:
+                    replacements[row["row_id"]] = row
+
+    replaced = 0
+    tmp_path = f"{answers_path}.tmp"
+    with profiling.span("write"):
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f_out:
+                for batch in iter_batches(answers_path):
+                    for row_id, row in batch:
+                        new_row = replacements.get(row_id)
+                        # файл ответов мог быть пересобран после verify — сверяем вопрос
+                        if new_row is not None and new_row["request"] == row["request"]:
+                            row = {k: v for k, v in new_row.items() if k != "row_id"}
+                            replaced += 1
+                        f_out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, answers_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    if without_id:
+        print(f"⚠️ Пропущено {without_id} строк без row_id: это не выход get_answers --input {REQUEUE_PATH}")
+    print(f"Заменено {replaced} из {len(regenerated)} перегенерированных ответов в {answers_path}")
+    return replaced
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проверка обоснованности ответов по контексту")
+    parser.add_argument("--answers", default=ANSWERS_PATH)
+    parser.add_argument("--merge", default=None, metavar="REGENERATED",
+                        help="подставить перегенерированные ответы из файла вместо проверки")
+    profiling.add_profile_argument(parser)
+    args = parser.parse_args()
+
+    with profiling.StageProfiler("verify_answers", enabled=args.profile):
+        if args.merge:
+            merge_regenerated(args.merge, args.answers)
+        else:
+            verify(args.answers)